@@ -17,21 +17,44 @@ IMPORTANT: Make sure ffmpeg is installed on your system and available in PATH.
 - Windows: Download from https://ffmpeg.org/download.html and add to PATH
 - Or use: choco install ffmpeg (if using Chocolatey)
 - Or use: winget install ffmpeg
+
+Intermediate files (separate video/audio streams before merging) can be kept
+on a RAM disk by setting the YTDL_TEMP environment variable, e.g. to a drive
+created with ImDisk on Windows. On Linux /dev/shm is used automatically when
+it has enough free space.
+
+Setting YTDL_ARIA2C=1 hands downloads to aria2c (if installed) for multiple
+connections per file. Progress reporting and cancelling do not work while
+aria2c is downloading.
 """
 
 import os
+import atexit
 import re
 import json
 import threading
-import tkinter as tk
-from tkinter import filedialog
 from flask import Flask, render_template, request, jsonify, Response
-import yt_dlp
 import queue
 import time
+import copy
+from collections import OrderedDict, deque
 from datetime import datetime
-import urllib.request
 import shutil
+import subprocess
+import functools
+import dataclasses
+from dataclasses import dataclass
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson  # Optional: much faster JSON encoding
+except ImportError:
+    orjson = None
 
 app = Flask(__name__)
 
@@ -39,19 +62,144 @@ app = Flask(__name__)
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
 FFMPEG_PATH = os.path.join(APP_DIR, 'ffmpeg.exe') if os.path.exists(os.path.join(APP_DIR, 'ffmpeg.exe')) else 'ffmpeg'
 
-# Global dictionaries for tracking
-download_progress = {}
-progress_queues = {}
-download_history = []  # Stores completed downloads
-active_downloads = {}  # Tracks active download threads
+# Optional aria2c for multi-connection downloads. Off unless YTDL_ARIA2C=1, because
+# yt-dlp runs it as a child process with no progress callbacks: the progress bar
+# stays at 0%, Cancel has no effect, and http_chunk_size/concurrent fragments are bypassed.
+ARIA2C_PATH = shutil.which('aria2c') if os.environ.get('YTDL_ARIA2C') == '1' else None
+ARIA2C_ARGS = ['-x', '16', '-s', '16', '-k', '1M', '--file-allocation=none', '--summary-interval=0']
+
+# Temp directory for intermediate files - RAM disk if configured or available.
+# Each process gets its own /dev/shm subdirectory so instances never clean up
+# each other's in-progress files.
+CONFIGURED_TEMP_DIR = os.environ.get('YTDL_TEMP')
+SHM_TEMP_DIR = os.path.join('/dev/shm', 'ytdl', str(os.getpid()))
+SHM_MIN_FREE = 4 * 1024 * 1024 * 1024  # Fall back to disk below this much free RAM
+
+
+def resolve_temp_dir():
+    """
+    Pick the directory yt-dlp uses for intermediate files of one download.
+    /dev/shm is only used while it still has SHM_MIN_FREE available, since
+    concurrent downloads share it. Returns None to keep yt-dlp's default
+    (next to the final file).
+    """
+    if CONFIGURED_TEMP_DIR:
+        os.makedirs(CONFIGURED_TEMP_DIR, exist_ok=True)
+        return CONFIGURED_TEMP_DIR
+    
+    try:
+        if shutil.disk_usage('/dev/shm').free >= SHM_MIN_FREE:
+            os.makedirs(SHM_TEMP_DIR, exist_ok=True)
+            return SHM_TEMP_DIR
+    except OSError:
+        pass  # No /dev/shm on this platform
+    return None
+
+
+@atexit.register
+def remove_shm_temp_dir():
+    """Remove this process's RAM disk directory on shutdown."""
+    shutil.rmtree(SHM_TEMP_DIR, ignore_errors=True)
 
 # Settings
 MAX_HISTORY = 50  # Maximum number of history items to keep
+MIN_VIDEO_HEIGHT = 144  # Ignore formats smaller than this
+RESOLUTION_TIERS = [(2160, '4K'), (1440, '2K'), (1080, 'Full HD'), (720, 'HD')]
+PROGRESS_KEEPALIVE = 15  # Seconds between SSE keepalive comments when idle
+INFO_CACHE_TTL = 300  # Seconds a /get_info result stays reusable
+INFO_CACHE_SIZE = 256  # Maximum number of cached /get_info results
+DOWNLOAD_WORKERS = int(os.environ.get('YTDL_WORKERS', 3))  # Downloads that run at once
+MAX_QUEUED_DOWNLOADS = 10  # Downloads allowed to wait for a free worker
+SERVER_THREADS = 16  # Request threads for waitress (each SSE listener holds one)
+
+@dataclass(frozen=True)
+class Progress:
+    """Immutable progress snapshot for one download session."""
+    status: str = 'starting'
+    progress: float = 0
+    speed: str = ''
+    eta: str = ''
+    filename: str = ''
+    filesize: str = ''
+    downloaded: str = ''
+    error: Optional[str] = None
+    complete: bool = False
+    title: str = ''
+    thumbnail: str = ''
+    path: str = ''
+
+
+# Global dictionaries for tracking
+download_progress = {}  # Session ID -> latest Progress snapshot
+progress_lock = threading.Lock()
+progress_queues = {}  # Session ID -> list of queues, one per /progress listener
+download_history = deque(maxlen=MAX_HISTORY)  # Stores completed downloads, newest first
+history_lock = threading.Lock()
+info_cache = OrderedDict()  # Canonical URL -> (expires_at, info, response)
+info_cache_lock = threading.Lock()
+active_downloads = {}  # Session ID -> Future for queued/running downloads
+download_pool = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix='download')
+
+# Shared HTTP session so repeated asset downloads reuse connections.
+# Transient failures are retried here instead of failing the whole download.
+HTTP_RETRY = Retry(total=2, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504))
+http_session = requests.Session()
+http_session.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                  '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+})
+http_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=HTTP_RETRY))
+http_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=HTTP_RETRY))
+
+COPY_CHUNK_SIZE = 1024 * 1024  # Read/write size when streaming assets to disk
+
+# Characters Windows rejects in filenames, including control characters
+INVALID_FILENAME_RE = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+YOUTUBE_HOST_RE = re.compile(r'youtube\.com|youtu\.be')
+
+# Single-video link styles: youtube.com/watch?v=<id>, youtube.com/{shorts,embed,live}/<id>, youtu.be/<id>
+YOUTUBE_HOSTS = {'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com'}
+YOUTUBE_PATH_KINDS = {'shorts', 'embed', 'live'}
+YOUTUBE_ID_RE = re.compile(r'[\w-]{11}')
+
+# Image extensions by Content-Type for thumbnail downloads
+IMAGE_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+}
+
+# Metadata extraction options; each request thread keeps one YoutubeDL for these
+INFO_YDL_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': False,
+}
+_ydl_local = threading.local()
+
+# Folder dialog - a single Tk thread owns the hidden root and serves requests
+_tk_requests = queue.Queue()
+_tk_thread = None
+_tk_lock = threading.Lock()
 
 
 def sanitize_filename(filename):
     """Remove invalid characters from filename."""
-    return re.sub(r'[<>:"/\\|?*]', '', filename)
+    return INVALID_FILENAME_RE.sub('', filename)
+
+
+def dumps_json(obj):
+    """Serialize to JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    if dataclasses.is_dataclass(obj):
+        obj = dataclasses.asdict(obj)
+    return json.dumps(obj).encode()
+
+
+def fast_jsonify(obj, status=200):
+    """jsonify() replacement for large payloads, backed by dumps_json."""
+    return Response(dumps_json(obj), status=status, mimetype='application/json')
 
 
 def format_filesize(bytes_size):
@@ -77,6 +225,193 @@ def format_duration(seconds):
     return f"{minutes:02d}:{secs:02d}"
 
 
+def format_speed(speed):
+    """Convert bytes/sec to a short rate string (KB/s or MB/s)."""
+    if not speed or speed <= 0:
+        return "--"
+    if speed >= 1 << 20:
+        return f"{speed / (1 << 20):.1f} MB/s"
+    return f"{speed / 1024:.0f} KB/s"
+
+
+def format_eta(eta):
+    """Convert remaining seconds to a compact string like 1h 5m or 3m 20s."""
+    if not eta or eta <= 0:
+        return "--"
+    hours, remainder = divmod(int(eta), 3600)
+    minutes, secs = divmod(remainder, 60)
+    if hours:
+        return f"{hours}h {minutes}m"
+    if minutes:
+        return f"{minutes}m {secs}s"
+    return f"{secs}s"
+
+
+def youtube_video_id(url):
+    """
+    Return the video ID of a single-video YouTube link, or None.
+    The URL is parsed rather than searched, so parameters such as ?dv= or a
+    second v= cannot make it name a different video than yt-dlp extracts.
+    """
+    if '://' not in url:
+        url = 'https://' + url
+    try:
+        parts = urlparse(url.strip())
+        host = (parts.hostname or '').lower()
+    except ValueError:
+        return None
+    segments = [seg for seg in parts.path.split('/') if seg]
+    candidate = None
+    if host == 'youtu.be':
+        if len(segments) == 1:
+            candidate = segments[0]
+    elif host in YOUTUBE_HOSTS:
+        if segments == ['watch']:
+            values = parse_qs(parts.query).get('v', [])
+            if len(values) == 1:
+                candidate = values[0]
+        elif len(segments) == 2 and segments[0] in YOUTUBE_PATH_KINDS:
+            candidate = segments[1]
+    if candidate and YOUTUBE_ID_RE.fullmatch(candidate):
+        return candidate
+    return None
+
+
+def canonical_url(url):
+    """Normalize single-video URLs so different link styles share a cache entry."""
+    if 'list=' in url:
+        return url
+    video_id = youtube_video_id(url)
+    if video_id:
+        return f'https://www.youtube.com/watch?v={video_id}'
+    return url
+
+
+def get_cached_info(url):
+    """Return the cached (expires_at, info, response) entry for a URL, if still fresh."""
+    key = canonical_url(url)
+    with info_cache_lock:
+        entry = info_cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del info_cache[key]
+            return None
+        info_cache.move_to_end(key)
+        return entry
+
+
+def cache_info(url, info, response):
+    """
+    Store extracted info and the /get_info response for a URL.
+    Single videos are keyed by the ID yt-dlp extracted, and only cached when
+    it is the video the URL names.
+    """
+    if info.get('_type') == 'playlist':
+        key = canonical_url(url)
+    elif info.get('id') and info['id'] == youtube_video_id(url):
+        key = f"https://www.youtube.com/watch?v={info['id']}"
+    else:
+        return
+    with info_cache_lock:
+        info_cache[key] = (time.monotonic() + INFO_CACHE_TTL, info, response)
+        info_cache.move_to_end(key)
+        while len(info_cache) > INFO_CACHE_SIZE:
+            info_cache.popitem(last=False)
+
+
+def resolution_option(height, fmt):
+    """Build a resolution option with a friendly label and file size estimate."""
+    label = f'{height}p'
+    for min_height, tier in RESOLUTION_TIERS:
+        if height >= min_height:
+            label = f'{tier} ({height}p)'
+            break
+    
+    filesize = fmt.get('filesize') or fmt.get('filesize_approx')
+    if filesize:
+        label += f' • ~{format_filesize(filesize)}'
+    
+    return {
+        'value': height,
+        'label': label,
+        'codec': fmt.get('vcodec', ''),
+        'filesize': filesize
+    }
+
+
+def get_info_ydl():
+    """
+    Return this thread's YoutubeDL for metadata extraction, creating it on
+    first use so extractor setup is paid once per thread, not per request.
+    """
+    import yt_dlp
+    ydl = getattr(_ydl_local, 'info_ydl', None)
+    if ydl is None:
+        ydl = yt_dlp.YoutubeDL(INFO_YDL_OPTS)
+        _ydl_local.info_ydl = ydl
+    return ydl
+
+
+def publish_progress(session_id, **updates):
+    """
+    Swap in a new Progress snapshot for a session and push it to every
+    listener's queue so that each /progress stream wakes up immediately.
+    """
+    with progress_lock:
+        progress = download_progress.get(session_id)
+        if progress is None:
+            return
+        progress = dataclasses.replace(progress, **updates)
+        download_progress[session_id] = progress
+    for q in list(progress_queues.get(session_id, ())):
+        q.put_nowait(progress)
+
+
+def _tk_dialog_worker():
+    """Own a long-lived hidden Tk root and run folder dialogs on it."""
+    try:
+        # Imported here so Tcl/Tk is only loaded once a dialog is requested
+        import tkinter as tk
+        from tkinter import filedialog
+        root = tk.Tk()
+        root.withdraw()  # Hide the main window
+        startup_error = None
+    except Exception as e:
+        root, startup_error = None, e
+    
+    while True:
+        options, reply = _tk_requests.get()
+        if root is None:
+            reply.put((False, startup_error))
+            continue
+        try:
+            root.attributes('-topmost', True)  # Bring dialog to front
+            root.focus_force()  # Force focus
+            reply.put((True, filedialog.askdirectory(parent=root, **options)))
+        except Exception as e:
+            reply.put((False, e))
+
+
+def ask_directory(**options):
+    """
+    Show a folder selection dialog on the Tk thread and wait for the result.
+    Starts the Tk thread on first use.
+    """
+    global _tk_thread
+    with _tk_lock:
+        if _tk_thread is None:
+            _tk_thread = threading.Thread(target=_tk_dialog_worker, daemon=True)
+            _tk_thread.start()
+    
+    reply = queue.Queue(maxsize=1)
+    _tk_requests.put((options, reply))
+    ok, result = reply.get()
+    if not ok:
+        raise result
+    return result
+
+
 @app.route('/')
 def index():
     """Serve the main page."""
@@ -89,6 +424,8 @@ def get_info():
     Extract video information and available formats from a YouTube URL.
     Returns comprehensive video details including formats, subtitles, etc.
     """
+    import yt_dlp  # Deferred so startup doesn't pay for loading yt-dlp
+    
     data = request.get_json()
     url = data.get('url', '').strip()
     
@@ -96,173 +433,142 @@ def get_info():
         return jsonify({'error': 'Please provide a valid URL'}), 400
     
     # Validate URL format (basic check for YouTube)
-    if not ('youtube.com' in url or 'youtu.be' in url):
+    if not YOUTUBE_HOST_RE.search(url):
         return jsonify({'error': 'Please provide a valid YouTube URL'}), 400
     
+    # Serve repeat lookups from the cache unless ?force=1 is given
+    if request.args.get('force') != '1':
+        cached = get_cached_info(url)
+        if cached:
+            return fast_jsonify(cached[2])
+    
     try:
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-        }
+        info = get_info_ydl().extract_info(url, download=False)
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            
-            # Check if it's a playlist
-            is_playlist = info.get('_type') == 'playlist'
-            
-            if is_playlist:
-                # Handle playlist
-                entries = info.get('entries', [])
-                playlist_info = {
-                    'is_playlist': True,
-                    'playlist_title': info.get('title', 'Unknown Playlist'),
-                    'playlist_count': len(entries),
-                    'playlist_id': info.get('id', ''),
-                    'videos': []
-                }
-                
-                for entry in entries[:20]:  # Limit to first 20 for preview
-                    if entry:
-                        playlist_info['videos'].append({
-                            'title': entry.get('title', 'Unknown'),
-                            'url': entry.get('url', ''),
-                            'duration': entry.get('duration', 0),
-                            'thumbnail': entry.get('thumbnail', '')
-                        })
-                
-                return jsonify({
-                    'success': True,
-                    **playlist_info
-                })
-            
-            # Single video
-            title = info.get('title', 'Unknown Title')
-            thumbnail = info.get('thumbnail', '')
-            duration = info.get('duration', 0)
-            channel = info.get('channel', info.get('uploader', 'Unknown'))
-            view_count = info.get('view_count', 0)
-            upload_date = info.get('upload_date', '')
-            description = info.get('description', '')[:500] if info.get('description') else ''
-            
-            # Extract available formats and resolutions
-            formats = info.get('formats', [])
-            resolutions = {}
-            
-            for fmt in formats:
-                height = fmt.get('height')
-                ext = fmt.get('ext', '')
-                vcodec = fmt.get('vcodec', 'none')
-                filesize = fmt.get('filesize') or fmt.get('filesize_approx')
-                tbr = fmt.get('tbr', 0)  # Total bitrate
-                
-                # Video formats
-                if height and height >= 144 and vcodec != 'none':
-                    if height not in resolutions or (tbr and tbr > resolutions[height].get('tbr', 0)):
-                        resolutions[height] = {
-                            'height': height,
-                            'ext': ext,
-                            'vcodec': vcodec,
-                            'filesize': filesize,
-                            'tbr': tbr
-                        }
-            
-            # Sort resolutions in descending order
-            sorted_resolutions = sorted(resolutions.keys(), reverse=True)
-            
-            # Create resolution options with friendly labels and file size estimates
-            resolution_options = []
-            for res in sorted_resolutions:
-                res_info = resolutions[res]
-                if res >= 2160:
-                    label = f'4K ({res}p)'
-                elif res >= 1440:
-                    label = f'2K ({res}p)'
-                elif res >= 1080:
-                    label = f'Full HD ({res}p)'
-                elif res >= 720:
-                    label = f'HD ({res}p)'
-                else:
-                    label = f'{res}p'
-                
-                # Add estimated file size if available
-                if res_info.get('filesize'):
-                    label += f' • ~{format_filesize(res_info["filesize"])}'
-                
-                resolution_options.append({
-                    'value': res,
-                    'label': label,
-                    'codec': res_info.get('vcodec', ''),
-                    'filesize': res_info.get('filesize')
-                })
-            
-            # Audio format options
-            audio_options = [
-                {'value': 'mp3-320', 'label': 'MP3 (320 kbps) - Best Quality'},
-                {'value': 'mp3-192', 'label': 'MP3 (192 kbps) - Standard'},
-                {'value': 'mp3-128', 'label': 'MP3 (128 kbps) - Smaller Size'},
-                {'value': 'm4a', 'label': 'M4A (AAC) - Apple Compatible'},
-                {'value': 'flac', 'label': 'FLAC - Lossless'},
-                {'value': 'wav', 'label': 'WAV - Uncompressed'},
-            ]
-            
-            # Get available subtitles
-            subtitles = info.get('subtitles', {})
-            auto_captions = info.get('automatic_captions', {})
-            
-            subtitle_options = []
-            seen_langs = set()
-            
-            # Manual subtitles first
-            for lang in subtitles.keys():
-                if lang not in seen_langs:
-                    seen_langs.add(lang)
-                    subtitle_options.append({
-                        'value': lang,
-                        'label': f'{lang.upper()} (Manual)',
-                        'auto': False
-                    })
+        # Check if it's a playlist
+        is_playlist = info.get('_type') == 'playlist'
+        
+        if is_playlist:
+            # Handle playlist
+            entries = info.get('entries', [])
+            playlist_info = {
+                'is_playlist': True,
+                'playlist_title': info.get('title', 'Unknown Playlist'),
+                'playlist_count': len(entries),
+                'playlist_id': info.get('id', ''),
+                'videos': []
+            }
             
-            # Then auto-generated (limit to common languages)
-            common_langs = ['en', 'es', 'fr', 'de', 'pt', 'it', 'ru', 'ja', 'ko', 'zh', 'ar', 'hi']
-            for lang in auto_captions.keys():
-                if lang in common_langs and lang not in seen_langs:
-                    seen_langs.add(lang)
-                    subtitle_options.append({
-                        'value': f'auto-{lang}',
-                        'label': f'{lang.upper()} (Auto-generated)',
-                        'auto': True
+            for entry in entries[:20]:  # Limit to first 20 for preview
+                if entry:
+                    playlist_info['videos'].append({
+                        'title': entry.get('title', 'Unknown'),
+                        'url': entry.get('url', ''),
+                        'duration': entry.get('duration', 0),
+                        'thumbnail': entry.get('thumbnail', '')
                     })
             
-            # Format upload date
-            formatted_date = ''
-            if upload_date:
-                try:
-                    date_obj = datetime.strptime(upload_date, '%Y%m%d')
-                    formatted_date = date_obj.strftime('%B %d, %Y')
-                except:
-                    formatted_date = upload_date
-            
-            return jsonify({
+            response = {
                 'success': True,
-                'is_playlist': False,
-                'video_id': info.get('id', ''),
-                'title': title,
-                'thumbnail': thumbnail,
-                'duration': duration,
-                'duration_formatted': format_duration(duration),
-                'channel': channel,
-                'view_count': view_count,
-                'view_count_formatted': f"{view_count:,}" if view_count else "0",
-                'upload_date': formatted_date,
-                'description': description,
-                'resolutions': resolution_options,
-                'audio_formats': audio_options,
-                'subtitles': subtitle_options,
-                'has_subtitles': len(subtitle_options) > 0
-            })
-            
+                **playlist_info
+            }
+            cache_info(url, info, response)
+            return fast_jsonify(response)
+        
+        # Single video
+        title = info.get('title', 'Unknown Title')
+        thumbnail = info.get('thumbnail', '')
+        duration = info.get('duration', 0)
+        channel = info.get('channel', info.get('uploader', 'Unknown'))
+        view_count = info.get('view_count', 0)
+        upload_date = info.get('upload_date', '')
+        description = info.get('description', '')[:500] if info.get('description') else ''
+        
+        # Keep the highest-bitrate video format for each height in one pass
+        best_by_height = {}
+        for fmt in info.get('formats', []):
+            height = fmt.get('height')
+            if not height or height < MIN_VIDEO_HEIGHT or fmt.get('vcodec', 'none') == 'none':
+                continue
+            tbr = fmt.get('tbr') or 0  # Total bitrate
+            current = best_by_height.get(height)
+            if current is None or tbr > current[0]:
+                best_by_height[height] = (tbr, fmt)
+        
+        # Create resolution options in descending order
+        resolution_options = [
+            resolution_option(height, fmt)
+            for height, (_, fmt) in sorted(best_by_height.items(), reverse=True)
+        ]
+        
+        # Audio format options
+        audio_options = [
+            {'value': 'mp3-320', 'label': 'MP3 (320 kbps) - Best Quality'},
+            {'value': 'mp3-192', 'label': 'MP3 (192 kbps) - Standard'},
+            {'value': 'mp3-128', 'label': 'MP3 (128 kbps) - Smaller Size'},
+            {'value': 'm4a', 'label': 'M4A (AAC) - Apple Compatible'},
+            {'value': 'flac', 'label': 'FLAC - Lossless'},
+            {'value': 'wav', 'label': 'WAV - Uncompressed'},
+        ]
+        
+        # Get available subtitles
+        subtitles = info.get('subtitles', {})
+        auto_captions = info.get('automatic_captions', {})
+        
+        subtitle_options = []
+        seen_langs = set()
+        
+        # Manual subtitles first
+        for lang in subtitles.keys():
+            if lang not in seen_langs:
+                seen_langs.add(lang)
+                subtitle_options.append({
+                    'value': lang,
+                    'label': f'{lang.upper()} (Manual)',
+                    'auto': False
+                })
+        
+        # Then auto-generated (limit to common languages)
+        common_langs = ['en', 'es', 'fr', 'de', 'pt', 'it', 'ru', 'ja', 'ko', 'zh', 'ar', 'hi']
+        for lang in auto_captions.keys():
+            if lang in common_langs and lang not in seen_langs:
+                seen_langs.add(lang)
+                subtitle_options.append({
+                    'value': f'auto-{lang}',
+                    'label': f'{lang.upper()} (Auto-generated)',
+                    'auto': True
+                })
+        
+        # Format upload date
+        formatted_date = ''
+        if upload_date:
+            try:
+                date_obj = datetime.strptime(upload_date, '%Y%m%d')
+                formatted_date = date_obj.strftime('%B %d, %Y')
+            except:
+                formatted_date = upload_date
+        
+        response = {
+            'success': True,
+            'is_playlist': False,
+            'video_id': info.get('id', ''),
+            'title': title,
+            'thumbnail': thumbnail,
+            'duration': duration,
+            'duration_formatted': format_duration(duration),
+            'channel': channel,
+            'view_count': view_count,
+            'view_count_formatted': f"{view_count:,}" if view_count else "0",
+            'upload_date': formatted_date,
+            'description': description,
+            'resolutions': resolution_options,
+            'audio_formats': audio_options,
+            'subtitles': subtitle_options,
+            'has_subtitles': len(subtitle_options) > 0
+        }
+        cache_info(url, info, response)
+        return fast_jsonify(response)
+        
     except yt_dlp.utils.DownloadError as e:
         error_msg = str(e)
         if 'Video unavailable' in error_msg:
@@ -283,20 +589,12 @@ def select_folder():
     Returns the selected folder path.
     """
     try:
-        # Create a hidden tkinter root window
-        root = tk.Tk()
-        root.withdraw()  # Hide the main window
-        root.attributes('-topmost', True)  # Bring dialog to front
-        root.focus_force()  # Force focus
-        
         # Open folder selection dialog
-        folder_path = filedialog.askdirectory(
+        folder_path = ask_directory(
             title='Select Download Folder',
             initialdir=os.path.expanduser('~\\Downloads')
         )
         
-        root.destroy()
-        
         if folder_path:
             # Normalize path for Windows
             folder_path = os.path.normpath(folder_path)
@@ -341,32 +639,22 @@ def download():
     if not os.path.isdir(save_path):
         return jsonify({'error': 'Invalid save path'}), 400
     
+    # Refuse new work once the pool and its backlog are full
+    if len(active_downloads) >= DOWNLOAD_WORKERS + MAX_QUEUED_DOWNLOADS:
+        return jsonify({'error': 'Too many downloads in progress. Please wait for some to finish.'}), 429
+    
     # Generate a unique session ID for this download
     session_id = f"{int(time.time() * 1000)}"
-    download_progress[session_id] = {
-        'status': 'starting',
-        'progress': 0,
-        'speed': '',
-        'eta': '',
-        'filename': '',
-        'filesize': '',
-        'downloaded': '',
-        'error': None,
-        'complete': False,
-        'title': '',
-        'thumbnail': ''
-    }
-    progress_queues[session_id] = queue.Queue()
+    download_progress[session_id] = Progress()
+    progress_queues[session_id] = []
     
-    # Start download in a separate thread
-    thread = threading.Thread(
-        target=download_video,
-        args=(url, resolution, save_path, session_id, 
-              download_subtitles, subtitle_lang, download_thumbnail)
+    # Queue the download on the bounded worker pool
+    future = download_pool.submit(
+        download_video, url, resolution, save_path, session_id,
+        download_subtitles, subtitle_lang, download_thumbnail
     )
-    thread.daemon = True
-    thread.start()
-    active_downloads[session_id] = thread
+    active_downloads[session_id] = future
+    future.add_done_callback(lambda _: active_downloads.pop(session_id, None))
     
     return jsonify({
         'success': True,
@@ -379,8 +667,11 @@ def download():
 def cancel_download(session_id):
     """Cancel an active download."""
     if session_id in download_progress:
-        download_progress[session_id]['status'] = 'cancelled'
-        download_progress[session_id]['complete'] = True
+        # Drop it from the pool if it hasn't started; running jobs stop in the hook
+        future = active_downloads.get(session_id)
+        if future is not None:
+            future.cancel()
+        publish_progress(session_id, status='cancelled', complete=True)
         return jsonify({'success': True, 'message': 'Download cancelled'})
     return jsonify({'error': 'Download not found'}), 404
 
@@ -391,16 +682,29 @@ def download_video(url, resolution, save_path, session_id,
     Download the video using yt-dlp with enhanced options.
     Updates progress in the global dictionary.
     """
+    import yt_dlp
+    
     last_update_time = 0
+    last_visible = None
     
     def progress_hook(d):
         """Callback function for download progress updates."""
-        nonlocal last_update_time
+        nonlocal last_update_time, last_visible
         
         # Check if cancelled
-        if download_progress.get(session_id, {}).get('status') == 'cancelled':
+        progress = download_progress.get(session_id)
+        if progress is None or progress.status == 'cancelled':
             raise Exception('Download cancelled by user')
         
+        # Pick up title/thumbnail from the extractor result on the first event
+        if not progress.title:
+            info = d.get('info_dict') or {}
+            publish_progress(
+                session_id,
+                title=info.get('title', ''),
+                thumbnail=info.get('thumbnail', '')
+            )
+        
         if d['status'] == 'downloading':
             # Throttle updates to every 50ms for performance
             current_time = time.time()
@@ -423,58 +727,40 @@ def download_video(url, resolution, save_path, session_id,
                 else:
                     percent = 0
             
-            speed = d.get('speed', 0)
-            if speed and speed > 0:
-                if speed >= 1024 * 1024:
-                    speed_str = f"{speed / 1024 / 1024:.1f} MB/s"
-                else:
-                    speed_str = f"{speed / 1024:.0f} KB/s"
-            else:
-                speed_str = "--"
+            percent = round(percent, 1)
+            speed_str = format_speed(d.get('speed'))
+            eta_str = format_eta(d.get('eta'))
             
-            eta = d.get('eta', 0)
-            if eta and eta > 0:
-                if eta >= 3600:
-                    eta_str = f"{eta // 3600}h {(eta % 3600) // 60}m"
-                elif eta >= 60:
-                    eta_str = f"{eta // 60}m {eta % 60}s"
-                else:
-                    eta_str = f"{eta}s"
-            else:
-                eta_str = "--"
+            # Skip the update entirely when nothing the user sees has changed
+            visible = (percent, speed_str, eta_str)
+            if visible == last_visible:
+                return
+            last_visible = visible
             
             filename = d.get('filename', '').split('\\')[-1].split('/')[-1]
             
-            download_progress[session_id].update({
-                'status': 'downloading',
-                'progress': round(percent, 1),
-                'speed': speed_str,
-                'eta': eta_str,
-                'filename': filename,
-                'filesize': format_filesize(total) if total else '--',
-                'downloaded': format_filesize(downloaded) if downloaded else '--'
-            })
+            publish_progress(
+                session_id,
+                status='downloading',
+                progress=percent,
+                speed=speed_str,
+                eta=eta_str,
+                filename=filename,
+                filesize=format_filesize(total) if total else '--',
+                downloaded=format_filesize(downloaded) if downloaded else '--'
+            )
             
         elif d['status'] == 'finished':
-            download_progress[session_id].update({
-                'status': 'processing',
-                'progress': 100,
-                'speed': '⚡',
-                'eta': 'Merging...'
-            })
+            publish_progress(
+                session_id,
+                status='processing',
+                progress=100,
+                speed='⚡',
+                eta='Merging...'
+            )
     
     try:
-        # First, get video info for history (use extract_flat for speed if just need basic info)
-        with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True, 'extract_flat': False}) as ydl:
-            info = ydl.extract_info(url, download=False)
-            video_title = info.get('title', 'Unknown')
-            video_thumbnail = info.get('thumbnail', '')
-            video_duration = info.get('duration', 0)
-            video_id = info.get('id', '')
-        
-        download_progress[session_id]['title'] = video_title
-        download_progress[session_id]['thumbnail'] = video_thumbnail
-        download_progress[session_id]['status'] = 'downloading'
+        publish_progress(session_id, status='downloading')
         
         # Base options - optimized for speed
         base_opts = {
@@ -489,7 +775,7 @@ def download_video(url, resolution, save_path, session_id,
             'retries': 3,
             'fragment_retries': 3,
             # Speed optimizations
-            'concurrent_fragment_downloads': 4,  # Download fragments in parallel
+            'concurrent_fragment_downloads': 8,  # Download fragments in parallel
             'buffersize': 1024 * 64,  # 64KB buffer
             'http_chunk_size': 10485760,  # 10MB chunks
             'throttledratelimit': None,  # No throttling
@@ -499,6 +785,16 @@ def download_video(url, resolution, save_path, session_id,
             'cachedir': False,
         }
         
+        # Keep intermediate streams on the RAM disk when one is available
+        temp_dir = resolve_temp_dir()
+        if temp_dir:
+            base_opts['paths']['temp'] = temp_dir
+        
+        # aria2c opens several range connections per file/fragment when enabled
+        if ARIA2C_PATH:
+            base_opts['external_downloader'] = {'default': ARIA2C_PATH}
+            base_opts['external_downloader_args'] = {'aria2c': ARIA2C_ARGS}
+        
         # Subtitle options
         if download_subtitles and subtitle_lang:
             if subtitle_lang.startswith('auto-'):
@@ -560,18 +856,32 @@ def download_video(url, resolution, save_path, session_id,
             }
             final_ext = 'mp4'
         
+        # Video details come from the same extraction that drives the download;
+        # reuse the extraction from /get_info when it is still fresh
+        cached = get_cached_info(url)
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+            if cached:
+                info = ydl.process_ie_result(copy.deepcopy(cached[1]), download=True)
+            else:
+                info = ydl.extract_info(url, download=True)
+        video_title = info.get('title', 'Unknown')
+        video_thumbnail = info.get('thumbnail', '')
+        video_duration = info.get('duration', 0)
+        video_id = info.get('id', '')
         
-        # Determine final filename
-        safe_title = sanitize_filename(video_title)
-        final_filename = f"{safe_title}.{final_ext}"
-        final_path = os.path.join(save_path, final_filename)
+        # Use the path yt-dlp actually wrote (after post-processing), falling back
+        # to the title-based name if it is not reported
+        requested = info.get('requested_downloads') or [{}]
+        final_path = requested[0].get('filepath')
+        if not final_path:
+            final_path = os.path.join(save_path, f"{sanitize_filename(video_title)}.{final_ext}")
+        final_filename = os.path.basename(final_path)
         
-        # Get actual file size
-        actual_filesize = "Unknown"
-        if os.path.exists(final_path):
-            actual_filesize = format_filesize(os.path.getsize(final_path))
+        # Get actual file size with a single stat call
+        try:
+            actual_filesize = format_filesize(os.stat(final_path).st_size)
+        except OSError:
+            actual_filesize = "Unknown"
         
         # Add to history
         history_entry = {
@@ -586,39 +896,36 @@ def download_video(url, resolution, save_path, session_id,
             'timestamp': datetime.now().isoformat(),
             'video_id': video_id
         }
-        download_history.insert(0, history_entry)
+        # Oldest entries fall off automatically once MAX_HISTORY is reached
+        with history_lock:
+            download_history.appendleft(history_entry)
         
-        # Trim history if needed
-        if len(download_history) > MAX_HISTORY:
-            download_history.pop()
-        
-        download_progress[session_id].update({
-            'status': 'complete',
-            'progress': 100,
-            'complete': True,
-            'filename': final_filename,
-            'filesize': actual_filesize,
-            'path': final_path
-        })
+        publish_progress(
+            session_id,
+            status='complete',
+            progress=100,
+            complete=True,
+            filename=final_filename,
+            filesize=actual_filesize,
+            path=final_path
+        )
         
     except Exception as e:
         error_msg = str(e)
         if 'cancelled' in error_msg.lower():
-            download_progress[session_id].update({
-                'status': 'cancelled',
-                'error': 'Download cancelled',
-                'complete': True
-            })
+            publish_progress(
+                session_id,
+                status='cancelled',
+                error='Download cancelled',
+                complete=True
+            )
         else:
-            download_progress[session_id].update({
-                'status': 'error',
-                'error': error_msg,
-                'complete': True
-            })
-    finally:
-        # Clean up active downloads
-        if session_id in active_downloads:
-            del active_downloads[session_id]
+            publish_progress(
+                session_id,
+                status='error',
+                error=error_msg,
+                complete=True
+            )
 
 
 @app.route('/progress/<session_id>')
@@ -627,36 +934,43 @@ def get_progress(session_id):
     Server-Sent Events endpoint for streaming download progress.
     """
     def generate():
-        retry_count = 0
-        max_retries = 5
-        last_progress = -1
-        
-        while True:
-            if session_id in download_progress:
-                progress = download_progress[session_id]
-                current_progress = progress.get('progress', 0)
-                
-                # Only send update if progress changed or status changed
-                if current_progress != last_progress or progress.get('complete'):
-                    yield f"data: {json.dumps(progress)}\n\n"
-                    last_progress = current_progress
-                
-                if progress.get('complete'):
-                    # Clean up after sending final status
-                    time.sleep(0.3)
-                    if session_id in download_progress:
-                        del download_progress[session_id]
-                    if session_id in progress_queues:
-                        del progress_queues[session_id]
-                    break
-                retry_count = 0
-            else:
-                retry_count += 1
-                if retry_count > max_retries:
-                    yield f"data: {json.dumps({'error': 'Session not found'})}\n\n"
-                    break
+        listeners = progress_queues.get(session_id)
+        if listeners is None or session_id not in download_progress:
+            yield b"data: " + dumps_json({'error': 'Session not found'}) + b"\n\n"
+            return
+        
+        # Subscribe before reading the current state so no update is missed
+        q = queue.Queue()
+        listeners.append(q)
+        try:
+            item = download_progress.get(session_id) or Progress(
+                status='error', error='Session not found', complete=True)
+            yield b"data: " + dumps_json(item) + b"\n\n"
             
-            time.sleep(0.1)  # Faster updates for smoother progress
+            # Block until the worker publishes an update instead of polling
+            while not item.complete:
+                try:
+                    item = q.get(timeout=PROGRESS_KEEPALIVE)
+                except queue.Empty:
+                    yield b": keepalive\n\n"
+                    continue
+                
+                # Coalesce a backlog into the latest snapshot; the final one is
+                # always the last item published, so it is never skipped
+                while not item.complete:
+                    try:
+                        item = q.get_nowait()
+                    except queue.Empty:
+                        break
+                yield b"data: " + dumps_json(item) + b"\n\n"
+        finally:
+            # Also runs when the client disconnects mid-stream
+            if q in listeners:
+                listeners.remove(q)
+        
+        # Clean up after sending final status
+        download_progress.pop(session_id, None)
+        progress_queues.pop(session_id, None)
     
     return Response(
         generate(),
@@ -672,17 +986,19 @@ def get_progress(session_id):
 @app.route('/history', methods=['GET'])
 def get_history():
     """Get download history."""
-    return jsonify({
+    with history_lock:
+        history = list(download_history)
+    return fast_jsonify({
         'success': True,
-        'history': download_history
+        'history': history
     })
 
 
 @app.route('/history/clear', methods=['POST'])
 def clear_history():
     """Clear download history."""
-    global download_history
-    download_history = []
+    with history_lock:
+        download_history.clear()
     return jsonify({'success': True, 'message': 'History cleared'})
 
 
@@ -691,12 +1007,12 @@ def get_active_downloads():
     """Get list of active downloads."""
     active = []
     for session_id, progress in download_progress.items():
-        if not progress.get('complete'):
+        if not progress.complete:
             active.append({
                 'session_id': session_id,
-                **progress
+                **dataclasses.asdict(progress)
             })
-    return jsonify({
+    return fast_jsonify({
         'success': True,
         'active': active
     })
@@ -709,58 +1025,60 @@ def open_folder():
     path = data.get('path', '')
     
     if path and os.path.exists(path):
-        if os.path.isfile(path):
-            # If it's a file, open the containing folder and select the file
-            os.system(f'explorer /select,"{path}"')
-        else:
-            # If it's a folder, just open it
-            os.startfile(path)
+        try:
+            if os.path.isfile(path):
+                # If it's a file, open the containing folder and select the file
+                # (no shell involved, and we don't wait for explorer to exit)
+                subprocess.Popen(['explorer', f'/select,{path}'])
+            else:
+                # If it's a folder, just open it
+                os.startfile(path)
+        except OSError as e:
+            return jsonify({'error': f'Failed to open folder: {str(e)}'}), 500
         return jsonify({'success': True})
     return jsonify({'error': 'Path not found'}), 404
 
 
-@app.route('/check_ffmpeg', methods=['GET'])
-def check_ffmpeg():
-    """Check if ffmpeg is installed and accessible."""
-    # First check for local ffmpeg in app directory
+def _ffmpeg_version(path):
+    """Return the first line of `ffmpeg -version` for the given binary."""
+    try:
+        result = subprocess.run([path, '-version'],
+                                capture_output=True, text=True, timeout=5)
+        return result.stdout.split('\n')[0] if result.stdout else 'Unknown version'
+    except Exception:
+        return 'Unknown version'
+
+
+@functools.lru_cache(maxsize=1)
+def probe_ffmpeg():
+    """
+    Locate ffmpeg and read its version once per process.
+    The result is cached because the binary does not change while running.
+    """
+    # First check for local ffmpeg in app directory, then system PATH
     if os.path.exists(FFMPEG_PATH):
-        # Get version info
-        try:
-            import subprocess
-            result = subprocess.run([FFMPEG_PATH, '-version'], 
-                                    capture_output=True, text=True, timeout=5)
-            version = result.stdout.split('\n')[0] if result.stdout else 'Unknown version'
-        except:
-            version = 'Unknown version'
-        
-        return jsonify({
-            'installed': True,
-            'path': FFMPEG_PATH,
-            'version': version
-        })
-    
-    # Then check system PATH
-    ffmpeg_path = shutil.which('ffmpeg')
+        ffmpeg_path = FFMPEG_PATH
+    else:
+        ffmpeg_path = shutil.which('ffmpeg')
     
     if ffmpeg_path:
-        try:
-            import subprocess
-            result = subprocess.run([ffmpeg_path, '-version'], 
-                                    capture_output=True, text=True, timeout=5)
-            version = result.stdout.split('\n')[0] if result.stdout else 'Unknown version'
-        except:
-            version = 'Unknown version'
-        
-        return jsonify({
+        return {
             'installed': True,
             'path': ffmpeg_path,
-            'version': version
-        })
-    else:
-        return jsonify({
-            'installed': False,
-            'message': 'ffmpeg is not installed or not in PATH. Please install it for video merging to work.'
-        })
+            'version': _ffmpeg_version(ffmpeg_path)
+        }
+    return {
+        'installed': False,
+        'message': 'ffmpeg is not installed or not in PATH. Please install it for video merging to work.'
+    }
+
+
+@app.route('/check_ffmpeg', methods=['GET'])
+def check_ffmpeg():
+    """Check if ffmpeg is installed and accessible. Use ?refresh=1 to re-probe."""
+    if request.args.get('refresh') == '1':
+        probe_ffmpeg.cache_clear()
+    return jsonify(probe_ffmpeg())
 
 
 @app.route('/download_thumbnail', methods=['POST'])
@@ -778,17 +1096,25 @@ def download_thumbnail_image():
         # Sanitize filename
         safe_filename = sanitize_filename(filename)
         
-        # Determine extension from URL
-        ext = 'jpg'
-        if '.png' in thumbnail_url:
-            ext = 'png'
-        elif '.webp' in thumbnail_url:
-            ext = 'webp'
-        
-        filepath = os.path.join(save_path, f"{safe_filename}_thumbnail.{ext}")
-        
-        # Download thumbnail
-        urllib.request.urlretrieve(thumbnail_url, filepath)
+        with http_session.get(thumbnail_url, stream=True, timeout=15) as r:
+            r.raise_for_status()
+            
+            # Determine extension from the response type, falling back to the URL
+            content_type = r.headers.get('Content-Type', '').split(';')[0].strip()
+            ext = IMAGE_EXTENSIONS.get(content_type)
+            if not ext:
+                ext = 'jpg'
+                if '.png' in thumbnail_url:
+                    ext = 'png'
+                elif '.webp' in thumbnail_url:
+                    ext = 'webp'
+            
+            filepath = os.path.join(save_path, f"{safe_filename}_thumbnail.{ext}")
+            
+            # Stream thumbnail to disk
+            r.raw.decode_content = True
+            with open(filepath, 'wb') as f:
+                shutil.copyfileobj(r.raw, f, COPY_CHUNK_SIZE)
         
         return jsonify({
             'success': True,
@@ -815,4 +1141,10 @@ if __name__ == '__main__':
     print("  - Or download from: https://ffmpeg.org/download.html")
     print("\n" + "="*60 + "\n")
     
-    app.run(host='localhost', port=5000, debug=True, threaded=True)
+    # Prefer waitress (bounded thread pool) and fall back to the Flask dev server
+    try:
+        from waitress import serve
+    except ImportError:
+        app.run(host='localhost', port=5000, debug=True, threaded=True)
+    else:
+        serve(app, host='localhost', port=5000, threads=SERVER_THREADS)
@@ -5,14 +5,99 @@ import uuid
 import time
 import threading
 import json
+import copy
+import atexit
 import logging
+import random
+import re
+import queue
+import tempfile
+import shutil
+import itertools
+import mimetypes
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from urllib.parse import quote, urlparse, parse_qs
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 app = Flask(__name__)
+# Number of proxies in front of the app (Render has one) whose X-Forwarded-For entry
+# is trusted, so request.remote_addr is the client; set PROXY_HOPS=0 when exposed directly
+PROXY_HOPS = int(os.environ.get('PROXY_HOPS', 1))
+if PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Store session data
-sessions = {}
+# Offload /serve file transfers to a fronting proxy (kernel sendfile instead of Python reads):
+#   USE_XACCEL=1      -> nginx X-Accel-Redirect; needs a matching internal location, e.g.
+#                        location /internal_downloads/ { internal; alias /app/downloads/; }
+#   USE_X_SENDFILE=1  -> Apache/lighttpd X-Sendfile (handled by Flask's send_file)
+USE_XACCEL = bool(os.environ.get('USE_XACCEL'))
+XACCEL_PREFIX = os.environ.get('XACCEL_PREFIX', '/internal_downloads/')
+app.config['USE_X_SENDFILE'] = bool(os.environ.get('USE_X_SENDFILE'))
+
+# Store session data (insertion ordered so the oldest can be evicted first)
+sessions = OrderedDict()
+sessions_lock = threading.Lock()
+# Guards each session's 'listeners' set (one wake-up Event per /progress stream)
+listeners_lock = threading.Lock()
+# IDs of sessions the reaper removed, so clients get 410 instead of 404
+reaped_sessions = OrderedDict()
+SESSION_TTL = 3600  # Seconds a finished session (and its file) is kept
+SESSION_MAX = 1000
+REAPER_INTERVAL = 60
+
+# Recent successful extractions: video_id -> (timestamp, info, client), least recently used first
+# Lets repeat lookups and the download step reuse what was already fetched
+info_cache = OrderedDict()
+INFO_CACHE_TTL = 3600
+INFO_CACHE_STALE = 3600  # Past the TTL, entries are still served for this long while refreshing
+INFO_CACHE_MAX = 2000
+refreshing = set()  # video_ids with a background refresh in flight (guarded by cache_lock)
+
+# Encoded /get_info bodies: video_id -> (timestamp, body, etag)
+info_responses = OrderedDict()
+RESPONSE_CACHE_TTL = 300
+RESPONSE_CACHE_MAX = 2000
+
+cache_lock = threading.Lock()
+
+# Extraction retry policy (per client; clients are tried concurrently)
+MAX_CLIENT_ATTEMPTS = 2
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30
+RETRY_JITTER = 0.5
+BOT_CHECK_RE = re.compile(r"confirm you.re not a bot|HTTP Error 403", re.IGNORECASE)
+TRANSIENT_ERROR_RE = re.compile(r'HTTP Error (?:429|5\d\d)|too many requests|timed out|connection reset|temporar', re.IGNORECASE)
+
+# Downloads run on a bounded pool; extra requests wait in its queue up to a limit
+MAX_DOWNLOADS = int(os.environ.get('MAX_DOWNLOADS', 8))
+MAX_QUEUED_DOWNLOADS = int(os.environ.get('MAX_QUEUED_DOWNLOADS', 16))
+MAX_DOWNLOADS_PER_IP = int(os.environ.get('MAX_DOWNLOADS_PER_IP', 3))  # Unfinished at once
+FRAGMENT_THREADS = int(os.environ.get('YTDLP_CFD', 4))  # Parallel fragments per HLS/DASH download
+download_pool = ThreadPoolExecutor(max_workers=MAX_DOWNLOADS, thread_name_prefix='dl')
+pending_downloads = 0
+pending_lock = threading.Lock()
+enqueue_seq = itertools.count()  # Submission order, used to report a queued download's position
+# (client_ip, video_id, format, is_audio, subtitles) -> session_id of the download running for it
+inflight_downloads = {}
+
+# Runs the concurrent per-client extraction attempts
+extract_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='extract')
+CLIENT_STAGGER = 0.2  # Head start for the preferred client before the next one is launched
+
+# Circuit breaker per player client: after BREAKER_THRESHOLD bot-check failures
+# in a row the client is skipped for BREAKER_COOLDOWN seconds
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 60
+breakers = {'web': {'fails': 0, 'until': 0}, 'android': {'fails': 0, 'until': 0}}
 
 # Ensure downloads directory exists
 DOWNLOAD_FOLDER = os.path.join(os.getcwd(), 'downloads')
@@ -20,21 +105,284 @@ if not os.path.exists(DOWNLOAD_FOLDER):
     os.makedirs(DOWNLOAD_FOLDER)
 
 # Ensure ffmpeg is executable if present in current dir
+# (skipped when already done, e.g. the module is imported again by a reloader)
 if os.path.exists('./ffmpeg'):
-    os.chmod('./ffmpeg', 0o755)
+    if not os.stat('./ffmpeg').st_mode & 0o111:
+        os.chmod('./ffmpeg', 0o755)
     # Add current directory to PATH so yt-dlp can find it
-    os.environ['PATH'] += os.pathsep + os.getcwd()
+    if os.getcwd() not in os.environ['PATH'].split(os.pathsep):
+        os.environ['PATH'] += os.pathsep + os.getcwd()
 
 # Handle Cookies from Environment Variable (for Render/Cloud deployment)
 if os.environ.get('YOUTUBE_COOKIES'):
-    with open('cookies.txt', 'w') as f:
-        f.write(os.environ['YOUTUBE_COOKIES'])
+    # Leave the file alone if a previous start on this disk already wrote the same cookies
+    try:
+        with open('cookies.txt') as f:
+            current = f.read()
+    except OSError:
+        current = None
+    if current != os.environ['YOUTUBE_COOKIES']:
+        with open('cookies.txt', 'w') as f:
+            f.write(os.environ['YOUTUBE_COOKIES'])
     logger.info("Loaded cookies.txt from environment variable")
 
+# cookies.txt is only written at startup, so check for it once here
+COOKIES_PATH = os.path.join(os.getcwd(), 'cookies.txt')
+if not os.path.exists(COOKIES_PATH):
+    COOKIES_PATH = None
+
+# Accepted links: youtube.com/watch?v=<id>, youtube.com/{shorts,embed,live}/<id> and youtu.be/<id>
+YT_HOSTS = {'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com',
+            'youtube-nocookie.com', 'www.youtube-nocookie.com'}
+YT_PATH_KINDS = {'shorts', 'embed', 'live'}
+YT_ID_RE = re.compile(r'[A-Za-z0-9_-]{11}')
+
+# yt-dlp options per player client, built once
+YDL_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'ydl-cache')
+YDL_BASE_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'nocheckcertificate': True,
+    'noplaylist': True,  # watch?v=...&list=... resolves to just the video, not every entry
+    'cachedir': YDL_CACHE_DIR,  # Keep deciphered player JS between extractions
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+}
+# Auto-translated caption tracks are never offered or downloaded, so don't build them
+YDL_CLIENT_OPTS = {
+    'web': {**YDL_BASE_OPTS, 'extractor_args': {'youtube': {'player_client': ['web'], 'skip': ['translated_subs']}}},
+    'android': {**YDL_BASE_OPTS, 'extractor_args': {'youtube': {'player_client': ['android'], 'skip': ['translated_subs']}}},
+}
+ydl_pools = {client: queue.LifoQueue() for client in YDL_CLIENT_OPTS}
+
+@atexit.register
+def _close_ydl_pools():
+    # Pooled instances are never used with `with`, so release their connections here
+    for pool in ydl_pools.values():
+        while True:
+            try:
+                ydl = pool.get_nowait()
+            except queue.Empty:
+                break
+            try: ydl.close()
+            except: pass
+
+def _track_pending(delta):
+    global pending_downloads
+    with pending_lock:
+        pending_downloads += delta
+
+def _reserve_download():
+    # Check and take a pool slot in one step; False when running plus queued is full
+    global pending_downloads
+    with pending_lock:
+        if pending_downloads >= MAX_DOWNLOADS + MAX_QUEUED_DOWNLOADS:
+            return False
+        pending_downloads += 1
+        return True
+
+def _dumps(obj):
+    # JSON bytes for SSE frames and /get_info; orjson when available
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+def _session_dir(session_id):
+    # Each download writes into its own folder, so sessions never share (or delete) a file
+    return os.path.join(DOWNLOAD_FOLDER, session_id)
+
+def _notify(session):
+    # Wake every /progress stream watching this session
+    with listeners_lock:
+        for ev in session['listeners']:
+            ev.set()
+
+def _queue_position(session):
+    # Number of downloads submitted earlier that are still waiting for a worker
+    seq = session['seq']
+    with sessions_lock:
+        return sum(1 for s in sessions.values() if s['status'] == 'queued' and s['seq'] < seq)
+
+def _notify_queued():
+    # A worker took (or a cancel dropped) a queued job; everyone behind it moved up
+    with sessions_lock:
+        waiting = [s for s in sessions.values() if s['status'] == 'queued']
+    for s in waiting:
+        _notify(s)
+
+def _discard_session(session_id):
+    # Caller must hold sessions_lock
+    sessions.pop(session_id)
+    shutil.rmtree(_session_dir(session_id), ignore_errors=True)
+    reaped_sessions[session_id] = None
+    while len(reaped_sessions) > SESSION_MAX:
+        reaped_sessions.popitem(last=False)
+
+def _add_session(session_id, session):
+    # Caller must hold sessions_lock
+    sessions[session_id] = session
+    if len(sessions) > SESSION_MAX:
+        # Evict the oldest finished session; running downloads are never dropped
+        for sid, s in sessions.items():
+            if s.get('finished_at'):
+                _discard_session(sid)
+                break
+
+def _reap_sessions():
+    while True:
+        time.sleep(REAPER_INTERVAL)
+        now = time.time()
+        with sessions_lock:
+            expired = [sid for sid, s in sessions.items()
+                       if s.get('finished_at') and now - s['finished_at'] > SESSION_TTL]
+            for sid in expired:
+                _discard_session(sid)
+        if expired:
+            logger.info(f"Reaped {len(expired)} expired sessions")
+
+threading.Thread(target=_reap_sessions, daemon=True).start()
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def _video_id(url):
+    # Parsed rather than searched, so other hosts or look-alike parameters (?dv=...)
+    # can't pass validation or map a URL onto a different video's cache entries
+    url = url.strip()
+    if '://' not in url:
+        url = 'https://' + url
+    try:
+        parts = urlparse(url)
+        host = (parts.hostname or '').lower()
+    except ValueError:
+        return None
+    if parts.scheme not in ('http', 'https'):
+        return None
+    segments = [seg for seg in parts.path.split('/') if seg]
+    candidate = None
+    if host == 'youtu.be':
+        if len(segments) == 1:
+            candidate = segments[0]
+    elif host in YT_HOSTS:
+        if segments == ['watch']:
+            values = parse_qs(parts.query).get('v', [])
+            if len(values) == 1:
+                candidate = values[0]
+        elif len(segments) == 2 and segments[0] in YT_PATH_KINDS:
+            candidate = segments[1]
+    if candidate and YT_ID_RE.fullmatch(candidate):
+        return candidate
+    return None
+
+def _build_ydl_opts(client, cookie_file=None):
+    # Fresh copy: callers extend it with download-specific options
+    ydl_opts = dict(YDL_CLIENT_OPTS[client])
+    if cookie_file:
+        ydl_opts['cookiefile'] = cookie_file
+    return ydl_opts
+
+@contextmanager
+def _shared_ydl(client):
+    # Borrow a pooled YoutubeDL for this client (built with the startup cookies),
+    # so extractor setup and the player JS cache are reused across requests
+    pool = ydl_pools[client]
+    try:
+        ydl = pool.get_nowait()
+    except queue.Empty:
+        ydl = yt_dlp.YoutubeDL(_build_ydl_opts(client, COOKIES_PATH))
+    try:
+        yield ydl
+    finally:
+        pool.put(ydl)
+
+def _cache_get(cache, key, ttl, stale=0):
+    # Entries are tuples whose first item is the time they were stored.
+    # Returns (entry, is_stale); entries older than ttl + stale are dropped.
+    with cache_lock:
+        entry = cache.get(key)
+        if entry is None:
+            return None, False
+        age = time.time() - entry[0]
+        if age >= ttl + stale:
+            del cache[key]
+            return None, False
+        cache.move_to_end(key)
+        return entry, age >= ttl
+
+def _cache_put(cache, key, maxsize, *values):
+    with cache_lock:
+        cache[key] = (time.time(), *values)
+        cache.move_to_end(key)
+        while len(cache) > maxsize:
+            cache.popitem(last=False)
+
+def _get_cached_info(video_id):
+    return _cache_get(info_cache, video_id, INFO_CACHE_TTL, INFO_CACHE_STALE)
+
+def _refresh_info(url, video_id, client):
+    try:
+        _extract_with_client(url, client, COOKIES_PATH, video_id)
+    except Exception as e:
+        logger.warning(f"Background refresh of {video_id} failed: {e}")
+    finally:
+        with cache_lock:
+            refreshing.discard(video_id)
+
+def _backoff_delay(attempt):
+    # Exponential backoff with jitter, capped
+    delay = RETRY_BASE_DELAY * (2 ** attempt) * (1 + random.random() * RETRY_JITTER)
+    return min(RETRY_MAX_DELAY, delay)
+
+def _record_block(client):
+    breaker = breakers[client]
+    breaker['fails'] += 1
+    if breaker['fails'] >= BREAKER_THRESHOLD:
+        logger.warning(f"Opening circuit for client {client} for {BREAKER_COOLDOWN}s")
+        breaker['until'] = time.monotonic() + BREAKER_COOLDOWN
+        breaker['fails'] = 0
+
+def _is_youtube_info(info, video_id):
+    # True if yt-dlp's YouTube extractor produced this info for exactly this video
+    return info.get('extractor_key') == 'Youtube' and info.get('id') == video_id
+
+def _store_info(video_id, info, client):
+    # Keyed by the ID yt-dlp reports, and only when it is the video that was asked for
+    if _is_youtube_info(info, video_id):
+        _cache_put(info_cache, info['id'], INFO_CACHE_MAX, info, client)
+
+def _extract_with_client(url, client, cookie_file, video_id):
+    # Transient failures (429/5xx/timeouts) get one delayed retry;
+    # anything else (bot check, 403, unavailable) fails straight away
+    for attempt in range(1, MAX_CLIENT_ATTEMPTS + 1):
+        try:
+            logger.info(f"Attempting extraction with client: {client}")
+            
+            ydl_opts = _build_ydl_opts(client, cookie_file)
+
+            # Per-request cookies need their own instance; otherwise use the pool
+            if cookie_file == COOKIES_PATH:
+                ydl_ctx = _shared_ydl(client)
+            else:
+                ydl_ctx = yt_dlp.YoutubeDL(ydl_opts)
+            with ydl_ctx as ydl:
+                info = ydl.extract_info(url, download=False)
+            # Only share results made with the server's own cookies; a user's cookies
+            # can unlock private/members-only videos and bind the stream URLs to them
+            if cookie_file == COOKIES_PATH:
+                _store_info(video_id, info, client)
+            breakers[client]['fails'] = 0
+            return info, ydl_opts
+                
+        except Exception as e:
+            logger.warning(f"Client {client} failed: {e}")
+            if BOT_CHECK_RE.search(str(e)):
+                _record_block(client)
+            if not TRANSIENT_ERROR_RE.search(str(e)) or attempt == MAX_CLIENT_ATTEMPTS:
+                raise
+            delay = _backoff_delay(attempt)
+            logger.info(f"Transient error on {client}, backing off {delay:.1f}s")
+            time.sleep(delay)
+
 def extract_info_safe(url, custom_cookies=None):
     """
     Standard extraction using direct URL.
@@ -46,46 +394,61 @@ def extract_info_safe(url, custom_cookies=None):
         cookie_file = os.path.join(DOWNLOAD_FOLDER, f"cookies_{uuid.uuid4()}.txt")
         with open(cookie_file, 'w') as f:
             f.write(custom_cookies)
-    elif os.path.exists(os.path.join(os.getcwd(), 'cookies.txt')):
-        cookie_file = os.path.join(os.getcwd(), 'cookies.txt')
+    elif COOKIES_PATH:
+        cookie_file = COOKIES_PATH
 
     try:
+        # Reuse a recent extraction of the same video (e.g. /get_info then /download)
+        video_id = _video_id(url) or url
+        cached, stale = _get_cached_info(video_id) if not custom_cookies else (None, False)
+        if cached:
+            _, info, client = cached
+            logger.info(f"Using cached extraction for {video_id} (client: {client})")
+            # Stale-while-revalidate: answer now, refresh in the background (once per video)
+            if stale:
+                with cache_lock:
+                    start = video_id not in refreshing
+                    refreshing.add(video_id)
+                if start:
+                    extract_pool.submit(_refresh_info, url, video_id, client)
+            return info, _build_ydl_opts(client, cookie_file), cookie_file
+        
         # Configuration:
         # If we have cookies -> Web Client is King (looks like real browser user)
         # If no cookies -> Android Client is safer (looks like mobile app)
+        # The order decides which client is tried (or, without cookies, raced) first
         
         clients = ['web', 'android'] if cookie_file else ['android', 'web']
         
-        last_error = None
+        # Skip clients that YouTube is currently bot-blocking
+        live = [c for c in clients if time.monotonic() >= breakers[c]['until']]
+        if not live:
+            raise Exception("YouTube is temporarily blocking this server. Please try again in a minute.")
         
-        for client in clients:
-            try:
-                logger.info(f"Attempting extraction with client: {client}")
-                
-                ydl_opts = {
-                    'quiet': True,
-                    'no_warnings': True,
-                    'nocheckcertificate': True,
-                    'cachedir': False,
-                    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                }
-                
+        # Give each client a short head start so a quick success on the
+        # preferred one saves the upstream call for the others. With cookies the
+        # clients run one after another so the account isn't used twice at once.
+        futures = []
+        for c in live:
+            if futures:
                 if cookie_file:
-                    ydl_opts['cookiefile'] = cookie_file
-                
-                if client == 'android':
-                    ydl_opts['extractor_args'] = {'youtube': {'player_client': ['android']}}
+                    wait(futures[-1:])
                 else:
-                    # Web client default
-                    ydl_opts['extractor_args'] = {'youtube': {'player_client': ['web']}}
-
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                    return info, ydl_opts, cookie_file
-                    
+                    wait(futures, timeout=CLIENT_STAGGER, return_when=FIRST_COMPLETED)
+                if any(f.done() and not f.exception() for f in futures):
+                    break
+            futures.append(extract_pool.submit(_extract_with_client, url, c, cookie_file, video_id))
+        last_error = None
+        for fut in as_completed(futures):
+            try:
+                info, ydl_opts = fut.result()
             except Exception as e:
-                logger.warning(f"Client {client} failed: {e}")
                 last_error = e
+                continue
+            # The slower attempt can't be interrupted mid-request; just stop waiting on it
+            for other in futures:
+                other.cancel()
+            return info, ydl_opts, cookie_file
         
         raise last_error
 
@@ -105,6 +468,26 @@ def get_info():
     if not url:
         return jsonify({'error': 'URL is required'}), 400
 
+    # Not a YouTube link: fail fast instead of running every client attempt
+    video_id = _video_id(url)
+    if not video_id:
+        return jsonify({'error': 'Please enter a valid YouTube URL'}), 400
+
+    # Repeat lookups of the same video get the stored body, or a 304 if the client has it.
+    # Lookups with the user's own cookies are never served from or stored in the cache.
+    cached = None
+    if not cookies:
+        cached, _ = _cache_get(info_responses, video_id, RESPONSE_CACHE_TTL)
+    if cached:
+        _, body, etag = cached
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+        else:
+            resp = Response(body, mimetype='application/json')
+        resp.set_etag(etag)
+        resp.headers['Cache-Control'] = 'private, max-age=60'
+        return resp
+
     try:
         info, _, temp_cookie = extract_info_safe(url, cookies)
         
@@ -114,28 +497,24 @@ def get_info():
              try: os.remove(temp_cookie)
              except: pass
         
-        resolutions = []
         audio_formats = []
         
-        formats = info.get('formats', [])
-        seen_res = set()
-        
-        for f in formats:
-            # Video formats
+        # First format seen for each height, keyed by the int height itself;
+        # storyboard images have a height too but no video codec
+        heights = {}
+        for f in info.get('formats', []):
             h = f.get('height')
-            if h and str(h).isdigit():
-                if h not in seen_res:
-                    resolutions.append({'value': f.get('format_id') or 'best', 'label': f'{h}p'})
-                    seen_res.add(h)
+            if isinstance(h, int) and h > 0 and h not in heights and f.get('vcodec') != 'none':
+                heights[h] = f.get('format_id') or 'best'
         
-        resolutions.sort(key=lambda x: int(x['label'][:-1]) if x['label'][:-1].isdigit() else 0, reverse=True)
+        resolutions = [{'value': v, 'label': f'{h}p'} for h, v in sorted(heights.items(), reverse=True)]
         
         if not resolutions:
              resolutions.append({'value': 'best', 'label': 'Best Quality'})
 
         audio_formats.append({'value': 'bestaudio/best', 'label': 'Best Quality (MP3)'})
 
-        return jsonify({
+        payload = {
             'title': info.get('title'),
             'thumbnail': info.get('thumbnail'),
             'duration_formatted': _format_duration(info.get('duration')),
@@ -144,54 +523,117 @@ def get_info():
             'uploadDate': info.get('upload_date'),
             'resolutions': resolutions,
             'audio_formats': audio_formats
-        })
+        }
+        # Encoded once; repeat lookups send the same bytes
+        body = _dumps(payload)
+        resp = Response(body, mimetype='application/json')
+        # Only a result verified as this YouTube video is cached (by yt-dlp's ID) or tagged
+        if _is_youtube_info(info, video_id):
+            etag = f"{info['id']}-{int(time.time())}"
+            if not cookies:
+                _cache_put(info_responses, info['id'], RESPONSE_CACHE_MAX, body, etag)
+            resp.set_etag(etag)
+            resp.headers['Cache-Control'] = 'private, max-age=60'
+        else:
+            resp.headers['Cache-Control'] = 'no-store'
+        return resp
 
     except Exception as e:
         logger.error(f"Error extracting info: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/cache/clear', methods=['POST'])
+def clear_cache():
+    # Protected by ADMIN_TOKEN when it is set
+    token = os.environ.get('ADMIN_TOKEN')
+    if token and request.headers.get('X-Admin-Token') != token:
+        return jsonify({'error': 'Forbidden'}), 403
+    with cache_lock:
+        info_cache.clear()
+        info_responses.clear()
+    return jsonify({'status': 'ok'})
+
+def _session_filesize(session):
+    # Formatted on first request, so unwatched downloads never pay for it
+    if 'filesize' not in session:
+        session['filesize'] = _format_mib(session['file_bytes'])
+    return session['filesize']
+
+def _format_mib(n):
+    return f"{n / (1024*1024):.2f} MiB"
+
 def _format_duration(seconds):
     if not seconds: return "--:--"
-    m, s = divmod(seconds, 60)
-    h, m = divmod(m, 60)
+    h, rest = divmod(int(seconds), 3600)
+    m, s = divmod(rest, 60)
     if h:
-        return f"{int(h)}:{int(m):02d}:{int(s):02d}"
-    return f"{int(m)}:{int(s):02d}"
+        return f"{h}:{m:02d}:{s:02d}"
+    return f"{m}:{s:02d}"
 
-def download_worker(session_id, url, format_id, is_audio, subtitles=False, cookies=None):
-    session = sessions[session_id]
-    
-    def progress_hook(d):
-        if session['cancel_event'].is_set():
+class ProgressReporter:
+    """yt-dlp progress hook that writes download progress into a session."""
+    __slots__ = ('session', 'cancel_event', 'last_pct', 'last_wake')
+
+    # Listeners are woken when the whole percent changes, or at least this often
+    WAKE_INTERVAL = 0.5
+
+    def __init__(self, session):
+        self.session = session
+        self.cancel_event = session['cancel_event']
+        self.last_pct = -1
+        self.last_wake = 0.0
+
+    def __call__(self, d):
+        if self.cancel_event.is_set():
             raise yt_dlp.utils.DownloadError("Download cancelled")
-            
-        if d['status'] == 'downloading':
-            p = d.get('_percent_str', '0%').replace('%','')
-            try:
-                session['progress'] = float(p)
-            except:
-                pass
+        
+        session = self.session
+        status = d['status']
+        if status == 'downloading':
+            # Only raw numbers are stored here; /progress formats them once per frame
             session['status'] = 'downloading'
-            session['speed'] = d.get('_speed_str', '--')
-            session['eta'] = d.get('_eta_str', '--')
-            session['downloaded'] = d.get('_total_bytes_str') or d.get('_total_bytes_estimate_str') or '--'
+            session['bytes_done'] = d.get('downloaded_bytes') or 0
+            session['bytes_total'] = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+            session['speed_bps'] = d.get('speed')
+            session['eta_s'] = d.get('eta')
+            # The hook runs once per buffer; only wake /progress when there's something to show
+            total = session['bytes_total']
+            pct = 100 * session['bytes_done'] // total if total else 0
+            now = time.monotonic()
+            if pct != self.last_pct or now - self.last_wake >= self.WAKE_INTERVAL:
+                self.last_pct = pct
+                self.last_wake = now
+                _notify(session)
             
-        elif d['status'] == 'finished':
+        elif status == 'finished':
             session['status'] = 'processing'
             session['progress'] = 99
-            session['temp_filename'] = d['filename']
+            _notify(session)
 
+def download_worker(session_id, url, format_id, is_audio, subtitles=False, cookies=None):
+    session = sessions[session_id]
+    session['status'] = 'starting'
+    _notify(session)
+    _notify_queued()
+    
     try:
-        # Re-run safe extraction to get the best client/opts for download
-        # This is robust because it handles the search trick and cookies
+        # Normally served from the cache /get_info filled; it also picks the client/opts
+        # and writes any per-request cookies
         info, ydl_opts, temp_cookie_path = extract_info_safe(url, cookies)
         
         # Merge our download-specific opts
         ydl_opts.update({
             'format': format_id if not is_audio else 'bestaudio/best',
-            'outtmpl': os.path.join(DOWNLOAD_FOLDER, '%(title)s.%(ext)s'),
-            'progress_hooks': [progress_hook],
+            'outtmpl': os.path.join(_session_dir(session_id), '%(title)s.%(ext)s'),
+            'progress_hooks': [ProgressReporter(session)],
             'noplaylist': True,
+            # Read the HTTP body in 1 MiB blocks so the copy loop (and the
+            # progress hook it calls) runs far fewer times per file
+            'buffersize': 1 << 20,
+            # Fetch in 10 MiB ranges over the kept-alive connection; YouTube throttles
+            # single unbounded requests
+            'http_chunk_size': 10 * 1024 * 1024,
+            'concurrent_fragment_downloads': FRAGMENT_THREADS,
         })
         
         if is_audio:
@@ -205,33 +647,36 @@ def download_worker(session_id, url, format_id, is_audio, subtitles=False, cooki
             ydl_opts['writesubtitles'] = True
 
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # We must use the info dict we already got, OR search again.
-            # Using search again is safer for the downloader to resolve the stream.
-            video_id = url
-            if 'v=' in url: video_id = url.split('v=')[-1].split('&')[0]
-            elif 'youtu.be' in url: video_id = url.split('/')[-1]
-            search_query = f"ytsearch1:{video_id}"
-            
-            info = ydl.extract_info(search_query, download=True)
-            # Info is now the playlist result, get first entry
-            if 'entries' in info:
-                info = info['entries'][0]
-
-            filename = ydl.prepare_filename(info)
-            if is_audio:
-                base = os.path.splitext(filename)[0]
-                filename = base + ".mp3"
+            video_id = _video_id(url)
+            if _is_youtube_info(info, video_id):
+                # Download from the extraction /get_info already did instead of resolving
+                # the video again; the cached dict is shared, so work on a private copy
+                info = ydl.process_ie_result(copy.deepcopy(info), download=True)
+            else:
+                # Not verifiably this YouTube video (or not a single video): extract it
+                # fresh from its canonical watch URL
+                info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=True)
+
+            # yt-dlp records the final path (after merging/MP3 conversion) on the
+            # download entry; only guess it from the template if that's missing
+            downloads = info.get('requested_downloads') or [{}]
+            filename = downloads[-1].get('filepath')
+            if not filename:
+                filename = ydl.prepare_filename(info)
+                if is_audio:
+                    filename = os.path.splitext(filename)[0] + ".mp3"
             
             session['filename'] = os.path.basename(filename)
             session['file_path'] = filename
             
-            if os.path.exists(filename):
-                session['status'] = 'complete'
-                session['progress'] = 100
-                sz = os.path.getsize(filename)
-                session['filesize'] = f"{sz / (1024*1024):.2f} MiB"
-            else:
+            # One stat both confirms the file exists and gives its final size
+            try:
+                session['file_bytes'] = os.stat(filename).st_size
+            except FileNotFoundError:
                 raise Exception("File not found after download")
+            session['progress'] = 100
+            session['status'] = 'complete'
+            _notify(session)
                 
         # Cleanup
         if temp_cookie_path and 'cookies_' in temp_cookie_path and os.path.exists(temp_cookie_path):
@@ -245,6 +690,16 @@ def download_worker(session_id, url, format_id, is_audio, subtitles=False, cooki
             logger.error(f"Download error: {e}")
             session['status'] = 'error'
             session['error'] = str(e)
+        _notify(session)
+    finally:
+        session['finished_at'] = time.time()
+
+def _download_done(key, session_id):
+    _track_pending(-1)
+    if key:
+        with sessions_lock:
+            if inflight_downloads.get(key) == session_id:
+                del inflight_downloads[key]
 
 @app.route('/download', methods=['POST'])
 def start_download():
@@ -256,64 +711,169 @@ def start_download():
     
     is_audio = 'audio' in str(resolution) or 'bestaudio' in str(resolution)
     
+    if not url or not _video_id(url):
+        return jsonify({'error': 'Please enter a valid YouTube URL'}), 400
+    
+    # remote_addr comes from ProxyFix, so it is only as trustworthy as PROXY_HOPS
+    client_ip = request.remote_addr
+    # A client repeating a download it already has in flight (double click, second tab)
+    # gets that session back. Only the same address shares, so nobody can cancel or
+    # piggyback on someone else's download; per-request cookies are never shared.
+    key = None if cookies else (client_ip, _video_id(url), resolution, is_audio, bool(subtitles))
     session_id = str(uuid.uuid4())
-    sessions[session_id] = {
-        'status': 'starting',
-        'progress': 0,
-        'cancel_event': threading.Event(),
-        'url': url
-    }
     
-    thread = threading.Thread(target=download_worker, args=(session_id, url, resolution, is_audio, subtitles, cookies))
-    thread.start()
+    # Everything below runs under one lock hold so parallel requests can't all pass
+    # the checks or start a second copy of the same download
+    with sessions_lock:
+        sid = inflight_downloads.get(key) if key else None
+        if sid in sessions and not sessions[sid].get('finished_at'):
+            return jsonify({'session_id': sid})
+        
+        # Bound each client too, so one can't take the whole backlog
+        active = sum(1 for s in sessions.values()
+                     if s.get('client_ip') == client_ip and not s.get('finished_at'))
+        if active >= MAX_DOWNLOADS_PER_IP:
+            return jsonify({'error': 'Too many downloads in progress. Please wait for one to finish.'}), 429
+        
+        # Bound the backlog so a burst of requests can't queue work forever
+        if not _reserve_download():
+            return jsonify({'error': 'Server is busy. Please try again shortly.'}), 429
+        
+        if key:
+            inflight_downloads[key] = session_id
+        _add_session(session_id, {
+            'client_ip': client_ip,
+            'status': 'queued',  # Until a pool worker picks it up
+            'seq': next(enqueue_seq),
+            'progress': 0,
+            'cancel_event': threading.Event(),
+            'listeners': set(),  # Events of the /progress streams, set whenever progress fields change
+            'url': url
+        })
+    
+    future = download_pool.submit(download_worker, session_id, url, resolution, is_audio, subtitles, cookies)
+    future.add_done_callback(lambda _: _download_done(key, session_id))
+    sessions[session_id]['future'] = future
     
     return jsonify({'session_id': session_id})
 
 @app.route('/progress/<session_id>')
 def progress(session_id):
+    if session_id in reaped_sessions:
+        return jsonify({'error': 'Session expired'}), 410
+
     def generate():
+        # Each stream has its own wake-up, so one listener clearing it can't make
+        # another miss an update
+        ev = threading.Event()
+        session = sessions.get(session_id)
+        if session:
+            with listeners_lock:
+                session['listeners'].add(ev)
+        try:
+            yield from frames(ev)
+        finally:
+            if session:
+                with listeners_lock:
+                    session['listeners'].discard(ev)
+
+    def frames(ev):
+        last = None
         while True:
             session = sessions.get(session_id)
             if not session:
-                yield f"data: {json.dumps({'error': 'Session not found'})}\n\n"
+                yield b"data: " + _dumps({'error': 'Session not found'}) + b"\n\n"
                 break
             
+            status = session['status']
+            pct = session.get('progress', 0)
+            speed = eta = downloaded = None
+            if status == 'downloading':
+                done, total = session.get('bytes_done', 0), session.get('bytes_total', 0)
+                if total:
+                    pct = round(100 * done / total, 1)
+                    downloaded = _format_mib(total)
+                bps = session.get('speed_bps')
+                speed = f"{_format_mib(bps)}/s" if bps else '--'
+                eta = _format_duration(session.get('eta_s'))
+            
             data = {
-                'status': session['status'],
-                'progress': session.get('progress', 0),
-                'speed': session.get('speed'),
-                'eta': session.get('eta'),
-                'downloaded': session.get('downloaded'),
+                'status': status,
+                'queued': _queue_position(session) if status == 'queued' else None,  # Jobs ahead of this one
+                'progress': pct,
+                'speed': speed,
+                'eta': eta,
+                'downloaded': downloaded,
                 'title': session.get('title'),
                 'filename': session.get('filename'),
-                'filesize': session.get('filesize'),
+                'filesize': _session_filesize(session) if status == 'complete' else None,
                 'error': session.get('error')
             }
             
-            yield f"data: {json.dumps(data)}\n\n"
+            # Unset fields are left out to keep each frame small; unchanged frames aren't resent
+            frame = b"data: " + _dumps({k: v for k, v in data.items() if v is not None}) + b"\n\n"
+            if frame != last:
+                yield frame
+                last = frame
             
-            if session['status'] in ['complete', 'error', 'cancelled']:
+            if status in ['complete', 'error', 'cancelled']:
                 break
             
-            time.sleep(1)
+            # Wake as soon as the worker reports progress; on a quiet stream send an
+            # SSE comment so proxies don't drop the connection
+            if not ev.wait(5.0):
+                yield b": keepalive\n\n"
+            ev.clear()
             
-    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+    # Tell proxies (Render's / nginx) not to buffer or cache the stream
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
 
 @app.route('/cancel/<session_id>', methods=['POST'])
 def cancel(session_id):
     session = sessions.get(session_id)
     if session:
         session['cancel_event'].set()
+        # A download still waiting in the pool queue can be dropped outright
+        future = session.get('future')
+        if future and future.cancel():
+            session['status'] = 'cancelled'
+            session['finished_at'] = time.time()
+            _notify(session)
+            _notify_queued()
     return jsonify({'status': 'ok'})
 
 @app.route('/serve/<session_id>')
 def serve(session_id):
+    if session_id in reaped_sessions:
+        return "File expired", 410
     session = sessions.get(session_id)
     if not session or not session.get('file_path') or not os.path.exists(session['file_path']):
         return "File not found or expired", 404
     
-    return send_file(session['file_path'], as_attachment=True, download_name=session['filename'])
+    if USE_XACCEL:
+        # nginx streams the file itself; this worker is released immediately
+        name = os.path.relpath(session['file_path'], DOWNLOAD_FOLDER).replace(os.sep, '/')
+        # nginx keeps the Content-Type set here, so don't let it default to text/html
+        mimetype = mimetypes.guess_type(session['filename'])[0] or 'application/octet-stream'
+        return Response('', mimetype=mimetype, headers={
+            'X-Accel-Redirect': XACCEL_PREFIX + quote(name),
+            'Content-Disposition': f"attachment; filename*=UTF-8''{quote(session['filename'])}",
+        })
+    
+    # conditional=True adds Range/If-None-Match support (resumable downloads)
+    return send_file(session['file_path'], as_attachment=True, download_name=session['filename'],
+                     conditional=True, etag=True)
 
 if __name__ == '__main__':
+    # Deployments go through gunicorn (see Procfile). Running the file directly
+    # prefers waitress and falls back to the threaded Flask dev server.
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
\ No newline at end of file
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        app.run(host='0.0.0.0', port=port, threaded=True)
+    else:
+        waitress_serve(app, host='0.0.0.0', port=port, threads=int(os.environ.get('WEB_THREADS', 32)))
\ No newline at end of file